@@ -0,0 +1,4 @@
+from jpeg_tools.main import app
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,69 @@
+from pathlib import Path
+
+from typer import Typer
+
+# 各スクリプトを1つのアプリのサブコマンドとしてまとめる
+# 重いモジュール（PIL、pillow_heif など）は各コマンドの実行時にのみ読み込む
+app = Typer(rich_markup_mode=None)
+
+
+@app.command()
+def convert(force: bool | None = None) -> None:
+    """
+    HEIF を含む .jpg/.jpeg ファイルを JPEG として出力する
+    省略したオプションはスクリプト側の既定値を使う
+
+    Args:
+        force: 出力先が最新でも再処理するか
+    """
+    from scripts.jpeg_converter.main import main
+
+    options = {"force": force}
+    main(**{key: value for key, value in options.items() if value is not None})
+
+
+@app.command()
+def compress(
+    input_directory: Path | None = None,
+    quality: int | None = None,
+    optimize: bool | None = None,
+    progressive: bool | None = None,
+) -> None:
+    """
+    フォルダ内のJPEG画像を圧縮する
+    省略したオプションはスクリプト側の既定値を使う
+
+    Args:
+        input_directory: 入力ディレクトリ
+        quality: 圧縮の品質（0-100）
+        optimize: ハフマンテーブルを最適化するか
+        progressive: プログレッシブJPEGとして保存するか
+    """
+    from scripts.jpeg_compressor.main import main
+
+    options = {
+        "input_directory": input_directory,
+        "quality": quality,
+        "optimize": optimize,
+        "progressive": progressive,
+    }
+    main(**{key: value for key, value in options.items() if value is not None})
+
+
+@app.command()
+def count(
+    input_directory: Path | None = None,
+    content_hash: bool | None = None,
+) -> None:
+    """
+    フォルダ内のJPEG画像をカウントし、重複を表示する
+    省略したオプションはスクリプト側の既定値を使う
+
+    Args:
+        input_directory: 検索対象のディレクトリ
+        content_hash: ファイルの内容で重複を判定するか
+    """
+    from scripts.jpeg_counter.main import main
+
+    options = {"input_directory": input_directory, "content_hash": content_hash}
+    main(**{key: value for key, value in options.items() if value is not None})
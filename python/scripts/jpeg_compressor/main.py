@@ -1,86 +1,389 @@
 import logging
+import os
+import sys
+from collections.abc import Iterable, Iterator
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
+)
 from datetime import datetime
+from itertools import product
 from pathlib import Path
 
-from PIL import Image
+from PIL import Image, features
 from rich.logging import RichHandler
 from rich.progress import track
 from typer import Typer
 
+# pyvips (libvips) が利用可能な場合は、画像全体をメモリに展開せずに
+# 行単位のストリーミングで圧縮する。利用できない場合は Pillow のみを使う
+try:
+    import pyvips
+except (ImportError, OSError):
+    pyvips = None
+else:
+    # 並列化はワーカープロセス単位で行うため、libvips 内部のスレッドは1本に抑え
+    # コア数×コア数のスレッドによる過剰な割り当てを防ぐ
+    pyvips.concurrency_set(1)
+    # 各ファイルは1度しか処理しないため、演算結果のキャッシュは不要
+    pyvips.cache_set_max(0)
+
 app = Typer()
 module_dir = Path(__file__).resolve().parent
 
 datetime_str = datetime.now().strftime("%Y%m%d_%H%M%S")
 
+# ワーカープロセスを再起動するまでに処理するファイル数
+TASKS_PER_WORKER = 500
+
+# 端末以外（CI、nohup など）へ出力する場合は Rich の装飾を使わない
+is_tty = sys.stdout.isatty()
+if is_tty:
+    console_handler: logging.Handler = RichHandler(rich_tracebacks=True)
+else:
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter("%(levelname)s - %(message)s"))
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(message)s",
     handlers=[
-        RichHandler(rich_tracebacks=True),
+        console_handler,
     ],
 )
 logger = logging.getLogger("jpeg_compressor")
 
 
-def compress_jpeg(input_path: Path, output_path: Path, quality: int):
+# JPEG の拡張子（大文字小文字のすべての組み合わせ）
+# str.endswith にタプルで渡し、lower() を呼ばずに判定する
+_JPEG_EXTS = tuple(
+    "." + "".join(chars)
+    for ext in ("jpg", "jpeg")
+    for chars in product(*((c, c.upper()) for c in ext))
+)
+
+
+def _walk_files(
+    root: str | os.PathLike[str], suffixes: tuple[str, ...]
+) -> Iterator[os.DirEntry[str]]:
+    """
+    os.scandir でディレクトリを再帰的に探索し、拡張子が一致するファイルの DirEntry を返す
+    DirEntry がキャッシュするファイル種別を使うため、余分な stat を発行しない
+    対象外のファイルは探索中に除外し、リストに積まない
+
+    Args:
+        root: 探索を開始するディレクトリ
+        suffixes: 対象とする拡張子（ドット付き、大文字小文字を区別する）
+
+    Yields:
+        os.DirEntry[str]: ファイルのエントリ
+    """
+    # 読み込めない・探索中に削除されたディレクトリはスキップし、残りの探索を続ける
+    try:
+        entries = os.scandir(root)
+    except OSError as e:
+        logger.warning("ディレクトリを読み込めないためスキップ: %s (%s)", root, e)
+        return
+
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_files(entry.path, suffixes)
+            # ".jpg" のように拡張子のみのファイル名（隠しファイル）は対象外
+            elif (
+                entry.name.endswith(suffixes)
+                and entry.name.rfind(".") > 0
+                and entry.is_file()
+            ):
+                yield entry
+
+
+def log_jpeg_backend() -> None:
+    """
+    Pillow がリンクしている JPEG ライブラリを確認してログに出力する
+
+    libjpeg-turbo (SIMD 対応) でない場合はエンコードが大幅に遅くなるため警告を出す。
+    libjpeg-turbo を有効にするには、システムに libjpeg-turbo を導入した上で
+    Pillow をソースから再ビルドする:
+        pip uninstall pillow
+        CFLAGS="-mavx2" pip install --no-binary :all: --force-reinstall pillow
+    """
+    jpeg_version = features.version("jpg")
+    if features.check_feature("libjpeg_turbo"):
+        logger.info(f"JPEGライブラリ: libjpeg-turbo {jpeg_version}")
+    else:
+        logger.warning(
+            f"libjpeg-turbo が無効です (libjpeg {jpeg_version})。"
+            "圧縮処理が低速になる可能性があります"
+        )
+
+    if pyvips is not None:
+        logger.info(f"圧縮エンジン: libvips {pyvips.version(0)}.{pyvips.version(1)}")
+    else:
+        logger.info("圧縮エンジン: Pillow (pyvips が利用できません)")
+
+
+def _save_with_vips(
+    file_path: Path,
+    output_file_path: Path,
+    quality: int,
+    optimize: bool,
+    progressive: bool,
+) -> None:
+    """
+    libvips で JPEG を圧縮して保存する
+    access="sequential" で読み込むため、画像全体ではなく数行分のバッファで処理される
+    EXIF・ICC プロファイル・XMP は jpegsave の既定の動作で保持される（Pillow 側と同じ方針）
+    クロマサブサンプリングは品質によらず 4:2:0 に固定する（Pillow 側と同じ方針）
+    既定の "auto" では品質90以上で 4:4:4 になり、Pillow より出力が大きくなるため
+
+    Args:
+        file_path (Path): 圧縮するJPEGファイルのパス
+        output_file_path (Path): 出力先のファイルパス
+        quality (int): 圧縮の品質（0-100）
+        optimize (bool): ハフマンテーブルを最適化するか
+        progressive (bool): プログレッシブJPEGとして保存するか
+    """
+    img = pyvips.Image.new_from_file(str(file_path), access="sequential")
+    img.jpegsave(
+        str(output_file_path),
+        Q=quality,
+        optimize_coding=optimize,
+        interlace=progressive,
+        subsample_mode="on",
+    )
+
+
+def _compress_one(
+    file_path: Path,
+    input_path: Path,
+    output_path: Path,
+    quality: int,
+    optimize: bool,
+    progressive: bool,
+) -> tuple[int, int, Path]:
+    """
+    1ファイルを圧縮する（ワーカープロセスで実行される）
+    pyvips が利用可能な場合は libvips を使い、失敗した場合は Pillow で処理する
+
+    Args:
+        file_path (Path): 圧縮するJPEGファイルのパス
+        input_path (Path): 入力ディレクトリのパス
+        output_path (Path): 出力ディレクトリのパス
+        quality (int): 圧縮の品質（0-100）
+        optimize (bool): ハフマンテーブルを最適化するか（2パスになるため低速）
+        progressive (bool): プログレッシブJPEGとして保存するか
+
+    Returns:
+        tuple[int, int, Path]: 圧縮前のサイズ、圧縮後のサイズ、入力パスからの相対パス
+    """
+    relative_path = file_path.relative_to(input_path)
+    output_file_path = output_path / relative_path
+
+    # 圧縮前のファイルサイズを取得
+    original_size = file_path.stat().st_size
+
+    saved = False
+    if pyvips is not None:
+        try:
+            _save_with_vips(
+                file_path, output_file_path, quality, optimize, progressive
+            )
+            saved = True
+        except pyvips.Error:
+            # libvips で処理できない場合は Pillow で再試行する
+            pass
+
+    if not saved:
+        with Image.open(file_path) as img:
+            # libvips と同様に EXIF・ICC プロファイル・XMP を引き継ぐ
+            metadata = {
+                key: img.info[key]
+                for key in ("exif", "icc_profile", "xmp")
+                if img.info.get(key)
+            }
+
+            # JPEGとして保存（圧縮）
+            # クロマサブサンプリングは libvips と同じく 4:2:0 に固定
+            img.save(
+                output_file_path,
+                "JPEG",
+                quality=quality,
+                optimize=optimize,
+                progressive=progressive,
+                subsampling="4:2:0",
+                **metadata,
+            )
+
+    # 圧縮後のファイルサイズを取得
+    compressed_size = output_file_path.stat().st_size
+
+    return original_size, compressed_size, relative_path
+
+
+def _iter_targets(input_path: Path, output_path: Path) -> Iterator[Path]:
+    """
+    圧縮対象のJPEGファイルを探索しながら1件ずつ返す
+    出力先のディレクトリは返す前に作成しておく
+
+    Args:
+        input_path (Path): 入力ディレクトリのパス
+        output_path (Path): 出力ディレクトリのパス
+
+    Yields:
+        Path: 圧縮するJPEGファイルのパス
+    """
+    # 作成済みの出力先ディレクトリ（同じディレクトリへの mkdir を繰り返さない）
+    created_dirs: set[Path] = set()
+
+    for entry in _walk_files(input_path, _JPEG_EXTS):
+        # 入力パスからの相対パスを計算
+        relative_path = os.path.relpath(entry.path, input_path)
+        # 出力先のファイルパスを作成
+        output_file_path = output_path / relative_path
+        # 出力先ディレクトリを確保
+        if output_file_path.parent not in created_dirs:
+            output_file_path.parent.mkdir(parents=True, exist_ok=True)
+            created_dirs.add(output_file_path.parent)
+
+        # ワーカープロセスへ渡すため Path に変換
+        yield Path(entry.path)
+
+
+def _compress_all(
+    executor: Executor,
+    work: Iterable[Path],
+    input_path: Path,
+    output_path: Path,
+    quality: int,
+    optimize: bool,
+    progressive: bool,
+    max_in_flight: int,
+) -> Iterator[tuple[Path, Future[tuple[int, int, Path]]]]:
+    """
+    ワーカーに圧縮処理を投入し、完了したものから順に返す
+    投入済みのタスク数を max_in_flight までに制限しつつ、各ワーカーに次のファイルを
+    待機させておくことで、あるワーカーの読み書き中も別のワーカーが圧縮を続けられる
+
+    Args:
+        executor (Executor): 圧縮処理を実行するエグゼキュータ
+        work (Iterable[Path]): 圧縮するJPEGファイルのパス
+        input_path (Path): 入力ディレクトリのパス
+        output_path (Path): 出力ディレクトリのパス
+        quality (int): 圧縮の品質（0-100）
+        optimize (bool): ハフマンテーブルを最適化するか
+        progressive (bool): プログレッシブJPEGとして保存するか
+        max_in_flight (int): 同時に投入するタスク数の上限
+
+    Yields:
+        tuple[Path, Future]: 入力ファイルのパスと完了した Future
+    """
+    pending: dict[Future[tuple[int, int, Path]], Path] = {}
+
+    for file_path in work:
+        # 上限に達したら、いずれかのタスクが完了するまで待つ
+        if len(pending) >= max_in_flight:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
+
+        future = executor.submit(
+            _compress_one,
+            file_path,
+            input_path,
+            output_path,
+            quality,
+            optimize,
+            progressive,
+        )
+        pending[future] = file_path
+
+    # 残りのタスクを完了順に返す
+    for future in as_completed(pending):
+        yield pending[future], future
+
+
+def compress_jpeg(
+    input_path: Path,
+    output_path: Path,
+    quality: int,
+    optimize: bool = True,
+    progressive: bool = False,
+):
     """
     フォルダ内のJPEG画像を圧縮し、元のフォルダ構成を維持しながら出力する
+    圧縮処理はCPUコア数分のプロセスで並列に実行する
 
     Args:
         input_dir (str): 入力ディレクトリのパス
         output_dir (str): 出力ディレクトリのパス
         quality (int): 圧縮の品質（0-100）、80は元の80%の品質を意味する
+        optimize (bool): ハフマンテーブルを最適化するか。
+            有効にするとファイルサイズは小さくなるが、2パスのエンコードになるため低速
+        progressive (bool): プログレッシブJPEGとして保存するか
     """
 
     # 出力ディレクトリが存在しない場合は作成
     output_path.mkdir(parents=True, exist_ok=True)
 
-    target_path = tuple(input_path.glob("**/*"))
+    # 進捗表示用に対象ファイル数だけを先に数える（パスは保持しない）
+    total = sum(1 for _ in _walk_files(input_path, _JPEG_EXTS))
 
-    # 再帰的にすべてのファイルを処理
-    for file_path in track(target_path):
-        # ディレクトリはスキップ
-        if file_path.is_dir():
-            logger.info(f"ディレクトリはスキップ: {file_path}")
-            continue
+    # 圧縮対象のファイルは探索しながら1件ずつワーカーへ渡す
+    work = _iter_targets(input_path, output_path)
 
-        # 入力パスからの相対パスを計算
-        relative_path = file_path.relative_to(input_path)
-        # 出力先のファイルパスを作成
-        output_file_path = output_path / relative_path
-        # 出力先ディレクトリを確保
-        output_file_path.parent.mkdir(parents=True, exist_ok=True)
+    max_workers = os.cpu_count() or 1
 
-        # JPEGファイルのみ処理
-        if file_path.suffix.lower() not in (".jpg", ".jpeg"):
-            logger.warning(f"JPEGファイルではありません: {file_path}")
-            continue
+    # ログ出力は重複を避けるため親プロセスで行う
+    # 長時間の処理でデコーダのバッファによりヒープが断片化しないよう、
+    # ワーカーは一定数のファイルを処理するごとに再起動してメモリを OS に返す
+    with ProcessPoolExecutor(
+        max_workers=max_workers, max_tasks_per_child=TASKS_PER_WORKER
+    ) as executor:
+        results = _compress_all(
+            executor,
+            work,
+            input_path,
+            output_path,
+            quality,
+            optimize,
+            progressive,
+            max_workers * 2,
+        )
 
-        try:
-            # 圧縮前のファイルサイズを取得
-            original_size = file_path.stat().st_size
+        for file_path, future in track(
+            results, total=total, update_period=0.5, disable=not is_tty
+        ):
+            try:
+                original_size, compressed_size, relative_path = future.result()
+            except Exception as e:
+                logger.error("エラー処理 %s: %s", file_path, e, exc_info=e)
+                continue
 
-            with Image.open(file_path) as img:
-                # 最適化フラグを追加してJPEGとして保存（圧縮）
-                img.save(output_file_path, "JPEG", quality=quality, optimize=True)
+            # ログが出力されない設定の場合は文字列の組み立てを省略
+            if not logger.isEnabledFor(logging.INFO):
+                continue
 
-                # 圧縮後のファイルサイズを取得
-                compressed_size = output_file_path.stat().st_size
-                ratio = compressed_size / original_size * 100
+            output_file_path = output_path / relative_path
+            ratio = compressed_size / original_size * 100
 
-                logger.info(
-                    f"圧縮: {file_path} -> {output_file_path} "
-                    f"({original_size:,} bytes -> {compressed_size:,} bytes, "
-                    f"{ratio:.1f}% of original)"
-                )
-        except Exception as e:
-            logger.error(f"エラー処理 {file_path}: {e}", exc_info=True)
+            logger.info(
+                f"圧縮: {file_path} -> {output_file_path} "
+                f"({original_size:,} bytes -> {compressed_size:,} bytes, "
+                f"{ratio:.1f}% of original)"
+            )
 
 
 @app.command()
 def main(
     input_directory: Path = module_dir / "../../../data/受領画像_整理済み",
     quality: int = 90,
+    optimize: bool = True,
+    progressive: bool = False,
 ) -> None:
     # 文字列が渡された場合に Path オブジェクトに変換
     input_path = Path(input_directory).resolve()
@@ -109,12 +412,14 @@ def main(
     logger.info(f"入力ディレクトリ: {input_path}")
     logger.info(f"出力ディレクトリ: {output_path}")
     logger.info(f"圧縮品質: {quality}")
+    logger.info(f"ハフマン最適化: {optimize}, プログレッシブ: {progressive}")
+    log_jpeg_backend()
 
     if input("圧縮を実行しますか？ (y/n): ").lower() != "y":
         logger.info("処理がキャンセルされました。")
         return
 
-    compress_jpeg(input_path, output_path, quality)
+    compress_jpeg(input_path, output_path, quality, optimize, progressive)
     logger.info("圧縮処理が完了しました。")
 
 
@@ -1,5 +1,10 @@
 import logging
+import os
+import shutil
+import sys
+from collections.abc import Iterator
 from datetime import datetime
+from itertools import product
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
@@ -9,7 +14,8 @@ from rich.logging import RichHandler
 from rich.progress import track
 from typer import Typer
 
-register_heif_opener()
+# 変換には主画像のみを使うため、HEIF 内のサムネイルは読み込まない
+register_heif_opener(thumbnails=False)
 
 app = Typer()
 
@@ -24,6 +30,9 @@ OUTPUT_DIR = (
     project_dir / "output" / "fixed_jpeg"
 )  # 実際の出力フォルダパスに変更してください
 
+# JPEG の SOI マーカー (FF D8) と最初のマーカー接頭辞 (FF)
+JPEG_MAGIC = b"\xff\xd8\xff"
+
 current_datetime = datetime.now()
 logging_dir = (
     project_dir / f"logs/fix_jpeg/{current_datetime.strftime('%Y-%m-%d_%H-%M-%S')}"
@@ -42,21 +51,78 @@ file_handler.setFormatter(
     )
 )
 
+# 端末以外（CI、nohup など）へ出力する場合は Rich の装飾を使わない
+is_tty = sys.stdout.isatty()
+if is_tty:
+    console_handler: logging.Handler = RichHandler(rich_tracebacks=True)
+else:
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter("%(levelname)s - %(message)s"))
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(message)s",
     datefmt="[%X]",
-    handlers=[RichHandler(rich_tracebacks=True), file_handler],
+    handlers=[console_handler, file_handler],
 )
 
 logger = logging.getLogger("fix_jpeg")
 
 
-def process_jpeg_files():
+# JPEG の拡張子（大文字小文字のすべての組み合わせ）
+# str.endswith にタプルで渡し、lower() を呼ばずに判定する
+_JPEG_EXTS = tuple(
+    "." + "".join(chars)
+    for ext in ("jpg", "jpeg")
+    for chars in product(*((c, c.upper()) for c in ext))
+)
+
+
+def _walk_files(
+    root: str | os.PathLike[str], suffixes: tuple[str, ...]
+) -> Iterator[os.DirEntry[str]]:
+    """
+    os.scandir でディレクトリを再帰的に探索し、拡張子が一致するファイルの DirEntry を返す
+    DirEntry がキャッシュするファイル種別を使うため、余分な stat を発行しない
+    対象外のファイルは探索中に除外し、リストに積まない
+
+    Args:
+        root: 探索を開始するディレクトリ
+        suffixes: 対象とする拡張子（ドット付き、大文字小文字を区別する）
+
+    Yields:
+        os.DirEntry[str]: ファイルのエントリ
+    """
+    # 読み込めない・探索中に削除されたディレクトリはスキップし、残りの探索を続ける
+    try:
+        entries = os.scandir(root)
+    except OSError as e:
+        logger.warning("ディレクトリを読み込めないためスキップ: %s (%s)", root, e)
+        return
+
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_files(entry.path, suffixes)
+            # ".jpg" のように拡張子のみのファイル名（隠しファイル）は対象外
+            elif (
+                entry.name.endswith(suffixes)
+                and entry.name.rfind(".") > 0
+                and entry.is_file()
+            ):
+                yield entry
+
+
+def process_jpeg_files(force: bool = False):
     """
     定義された入力ディレクトリを再帰的に探索し、JPEGファイルを無劣化で出力ディレクトリに保存します。
     ディレクトリ構造は維持されます。HEIFフォーマットが.jpegとして保存されている場合も
     JPEGとして出力します。
+    中身が既にJPEGのファイルは再エンコードせず、バイト単位でそのままコピーします。
+    出力先のファイルが入力ファイル以降に更新されている場合は処理をスキップします。
+
+    Args:
+        force (bool): True の場合、出力先が最新でも再処理する
     """
     input_path = Path(INPUT_DIR)
     output_path = Path(OUTPUT_DIR)
@@ -68,49 +134,98 @@ def process_jpeg_files():
     # 出力ディレクトリを作成（もし存在しなければ）
     output_path.mkdir(exist_ok=True, parents=True)
 
-    # 入力ディレクトリを再帰的に探索
-    filepaths = tuple(input_path.glob("**/*"))
-    for file_path in track(filepaths, description="画像を処理中..."):
+    # 進捗表示用に対象ファイル数だけを先に数える（パスは保持しない）
+    total = sum(1 for _ in _walk_files(input_path, _JPEG_EXTS))
+
+    # 作成済みの出力先ディレクトリ（同じディレクトリへの mkdir を繰り返さない）
+    created_dirs: set[Path] = set()
+
+    # 入力ディレクトリを再帰的に探索（JPEGファイルのみ）しながら1件ずつ処理
+    entries = _walk_files(input_path, _JPEG_EXTS)
+    for entry in track(
+        entries,
+        total=total,
+        description="画像を処理中...",
+        update_period=0.5,
+        disable=not is_tty,
+    ):
         # 相対パスを取得（入力ディレクトリからの相対パス）
-        relative_path = file_path.relative_to(input_path)
+        relative_path = os.path.relpath(entry.path, input_path)
         output_file = output_path / relative_path
 
-        # ディレクトリの場合、出力先に同じディレクトリ構造を作成
-        if file_path.is_dir():
-            output_file.mkdir(exist_ok=True, parents=True)
-            continue
+        # 出力先が既に存在し、入力ファイル以降に更新されている場合はスキップ
+        if not force:
+            try:
+                if output_file.stat().st_mtime_ns >= entry.stat().st_mtime_ns:
+                    logging.info("スキップ: %s は処理済みです", entry.path)
+                    continue
+            except FileNotFoundError:
+                pass
 
-        # JPEGファイルかどうかを確認
-        if file_path.suffix.lower() not in [".jpg", ".jpeg"]:
-            logging.info(f"スキップ: {file_path} は JPEG 形式ではありません")
-            continue
+        # Pillow に渡すため Path に変換
+        file_path = Path(entry.path)
 
         # 出力先のディレクトリがまだ存在しない場合は作成
-        output_file.parent.mkdir(exist_ok=True, parents=True)
+        if output_file.parent not in created_dirs:
+            output_file.parent.mkdir(exist_ok=True, parents=True)
+            created_dirs.add(output_file.parent)
 
-        try:
-            # 画像を開く
-            img = Image.open(file_path)
-            actual_format = img.format
+        # 中断されても不完全なファイルが出力先に残らないよう、一時ファイルに
+        # 書き込んでから置き換える（途中のファイルが処理済みと判定されるのを防ぐ）
+        tmp_file = output_file.with_name(output_file.name + ".tmp")
 
-            logging.info(f"ファイル: {file_path}, 検出された形式: {actual_format}")
-
-            # どのような形式でもJPEGとして保存
-            img.save(output_file, format="JPEG", quality=100, subsampling=0)
-            logging.info(f"JPEG として保存しました: {output_file}")
+        try:
+            # 先頭バイトで実際の形式を判定
+            with open(file_path, "rb") as f:
+                header = f.read(12)
+
+            # 中身が JPEG の場合は再エンコードせずにコピー
+            if header.startswith(JPEG_MAGIC):
+                shutil.copyfile(file_path, tmp_file)
+                os.replace(tmp_file, output_file)
+                logging.info("JPEG をそのままコピーしました: %s", output_file)
+                continue
+
+            # JPEG 以外（HEIF など）は画像を開いて変換
+            # with で閉じることでデコーダのバッファを即座に解放する
+            with Image.open(file_path) as img:
+                actual_format = img.format
+
+                logging.info(
+                    "ファイル: %s, 検出された形式: %s", file_path, actual_format
+                )
+
+                # 画質を優先し、品質100・4:4:4（クロマサブサンプリングなし）で保存
+                # optimize/progressive は2パスのエンコードになり低速なため明示的に無効化
+                img.save(
+                    tmp_file,
+                    format="JPEG",
+                    quality=100,
+                    subsampling=0,
+                    optimize=False,
+                    progressive=False,
+                )
+            os.replace(tmp_file, output_file)
+            logging.info("JPEG として保存しました: %s", output_file)
 
         except UnidentifiedImageError as e:
             # 画像として開けない場合はエラーを報告
-            logging.error(f"エラー: {file_path} は画像として認識できませんでした")
+            logging.error("エラー: %s は画像として認識できませんでした", file_path)
             logging.error(e, exc_info=True)
 
         except Exception as e:
-            logging.error(f"エラー: {file_path} の処理中にエラーが発生しました - {e}")
+            logging.error(
+                "エラー: %s の処理中にエラーが発生しました - %s", file_path, e
+            )
             logging.error(e, exc_info=True)
 
+        finally:
+            # 置き換え前に失敗・中断した場合の一時ファイルを削除
+            tmp_file.unlink(missing_ok=True)
+
 
 @app.command()
-def main():
+def main(force: bool = False):
     # PIL が HEIF 形式をサポートしているか確認するメッセージ
     logging.info(
         "注意: HEIFフォーマットを処理するには 'pillow-heif' パッケージが必要な場合があります。"
@@ -118,7 +233,7 @@ def main():
     logging.info("インストールするには: pip install pillow-heif")
     logging.info("処理を開始します...")
 
-    process_jpeg_files()
+    process_jpeg_files(force)
     logging.info("処理が完了しました。")
 
 
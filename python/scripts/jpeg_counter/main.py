@@ -1,6 +1,12 @@
+import hashlib
 import logging
-from collections import Counter
-from datetime import datetime
+import os
+import sys
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
 from pathlib import Path
 
 from rich.console import Console
@@ -8,15 +14,131 @@ from rich.logging import RichHandler
 from rich.table import Table
 from typer import Typer
 
+# 端末以外（CI、nohup など）へ出力する場合は Rich の装飾を使わない
+is_tty = sys.stdout.isatty()
+if is_tty:
+    console_handler: logging.Handler = RichHandler(rich_tracebacks=True)
+else:
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter("%(levelname)s - %(message)s"))
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(message)s",
     handlers=[
-        RichHandler(rich_tracebacks=True),
+        console_handler,
     ],
 )
 logger = logging.getLogger("jpeg_counter")
 
+
+# JPEG の拡張子（大文字小文字のすべての組み合わせ）
+# str.endswith にタプルで渡し、lower() を呼ばずに判定する
+_JPEG_EXTS = tuple(
+    "." + "".join(chars)
+    for ext in ("jpg", "jpeg")
+    for chars in product(*((c, c.upper()) for c in ext))
+)
+
+
+def _walk_files(
+    root: str | os.PathLike[str], suffixes: tuple[str, ...]
+) -> Iterator[os.DirEntry[str]]:
+    """
+    os.scandir でディレクトリを再帰的に探索し、拡張子が一致するファイルの DirEntry を返す
+    DirEntry がキャッシュするファイル種別を使うため、余分な stat を発行しない
+    対象外のファイルは探索中に除外し、リストに積まない
+
+    Args:
+        root: 探索を開始するディレクトリ
+        suffixes: 対象とする拡張子（ドット付き、大文字小文字を区別する）
+
+    Yields:
+        os.DirEntry[str]: ファイルのエントリ
+    """
+    # 読み込めない・探索中に削除されたディレクトリはスキップし、残りの探索を続ける
+    try:
+        entries = os.scandir(root)
+    except OSError as e:
+        logger.warning("ディレクトリを読み込めないためスキップ: %s (%s)", root, e)
+        return
+
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_files(entry.path, suffixes)
+            # ".jpg" のように拡張子のみのファイル名（隠しファイル）は対象外
+            elif (
+                entry.name.endswith(suffixes)
+                and entry.name.rfind(".") > 0
+                and entry.is_file()
+            ):
+                yield entry
+
+
+def _hash_file(path: str) -> str | None:
+    """
+    ファイル全体の BLAKE2b ハッシュ値を返す
+    hashlib は大きなデータの処理中に GIL を解放するため、スレッドで並列に実行できる
+
+    Args:
+        path: ハッシュ値を計算するファイルのパス
+
+    Returns:
+        str | None: 16進数のハッシュ値。ファイルを読み込めない場合は None
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+    except OSError as e:
+        logger.warning("ファイルを読み込めないため除外: %s (%s)", path, e)
+        return None
+    return digest.hexdigest()
+
+
+def _group_by_content(
+    entries: list[os.DirEntry[str]],
+) -> defaultdict[str, list[str]]:
+    """
+    ファイルの内容が一致するものをグループ化する
+    まずファイルサイズで分類し、サイズが一致したファイルのみハッシュ値を計算する
+    サイズの取得や読み込みに失敗したファイルはグループから除外する
+
+    Args:
+        entries: グループ化するファイルのエントリ
+
+    Returns:
+        defaultdict[str, list[str]]: ハッシュ値（サイズが一意のファイルはパス）ごとのパス一覧
+    """
+    size_paths: defaultdict[int, list[str]] = defaultdict(list)
+    for entry in entries:
+        try:
+            size = entry.stat().st_size
+        except OSError as e:
+            logger.warning("ファイルを読み込めないため除外: %s (%s)", entry.path, e)
+            continue
+        size_paths[size].append(entry.path)
+
+    content_paths: defaultdict[str, list[str]] = defaultdict(list)
+    candidates: list[str] = []
+    for paths in size_paths.values():
+        if len(paths) == 1:
+            # サイズが一意であれば内容も一意
+            content_paths[paths[0]].append(paths[0])
+        else:
+            candidates.extend(paths)
+
+    # ディスク読み込みが主なため、CPUコア数より多いスレッドで並列にハッシュ値を計算
+    with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2) as executor:
+        for path, digest in zip(candidates, executor.map(_hash_file, candidates)):
+            if digest is not None:
+                content_paths[digest].append(path)
+
+    return content_paths
+
+
 app = Typer()
 module_dir = Path(__file__).resolve().parent
 
@@ -24,6 +146,7 @@ module_dir = Path(__file__).resolve().parent
 @app.command()
 def main(
     input_directory: Path = module_dir / "../../../data/受領画像_整理済み",
+    content_hash: bool = False,
 ) -> None:
     """
     指定したディレクトリ内のJPEG画像を再帰的にカウントし、一意のファイル名の数を表示する
@@ -31,8 +154,9 @@ def main(
 
     Args:
         input_directory: 検索対象のディレクトリ
+        content_hash: True の場合、ファイル名ではなくファイルの内容で重複を判定する
     """
-    start_time = datetime.now()
+    start_time = time.perf_counter_ns()
 
     # 入力パスの解決
     input_path = Path(input_directory).resolve()
@@ -42,54 +166,61 @@ def main(
         logger.error(f"指定されたディレクトリが存在しません: {input_path}")
         return
 
+    # 重複の判定基準（ファイル名 or ファイルの内容）
+    key_label = "ハッシュ値" if content_hash else "ファイル名"
+
     # すべてのファイルを再帰的に取得し、JPEGのみをフィルタリング（サブディレクトリも検索）
-    all_files = input_path.rglob("*")  # rglob は再帰的に全ファイルを検索
-    jpeg_files = [
-        f for f in all_files if f.is_file() and f.suffix.lower() in (".jpg", ".jpeg")
-    ]
-
-    # Counter を直接活用してファイル名を集計
-    filename_counter = Counter(f.stem for f in jpeg_files)
-
-    # パスとファイル名のマッピングを作成（重複表示用）
-    filename_paths = {}
-    for file_path in jpeg_files:
-        stem = file_path.stem
-        if stem not in filename_paths:
-            filename_paths[stem] = []
-        filename_paths[stem].append(file_path)
+    # 拡張子のフィルタリングは探索中に行い、探索と同時にファイル名ごとのパス一覧を作成
+    # （Path は生成せず、DirEntry の文字列をそのまま使う）
+    jpeg_file_count = 0
+    group_paths: defaultdict[str, list[str]] = defaultdict(list)
+    jpeg_entries: list[os.DirEntry[str]] = []
+    for entry in _walk_files(input_path, _JPEG_EXTS):
+        if content_hash:
+            jpeg_entries.append(entry)
+        else:
+            group_paths[os.path.splitext(entry.name)[0]].append(entry.path)
+        jpeg_file_count += 1
+
+    # 内容で判定する場合はハッシュ値ごとのパス一覧を作成
+    if content_hash:
+        group_paths = _group_by_content(jpeg_entries)
+
+    # パス一覧の長さから出現回数を集計
+    group_counter = {name: len(paths) for name, paths in group_paths.items()}
 
     # 処理時間の計測
-    processing_time = (datetime.now() - start_time).total_seconds()
+    processing_time = (time.perf_counter_ns() - start_time) / 1e9
 
     # 結果の表示
     logger.info("\nJPEG画像カウント結果")
     logger.info(f"解析ディレクトリ: {input_path}")
-    logger.info(f"総JPEG画像ファイル数: {len(jpeg_files)}")
-    logger.info(f"一意のファイル名数: {len(filename_counter)}")
+    logger.info(f"総JPEG画像ファイル数: {jpeg_file_count}")
+    logger.info(f"一意の{key_label}数: {len(group_counter)}")
     logger.info(
-        f"重複ファイル名数: {sum(1 for c in filename_counter.values() if c > 1)}"
+        f"重複{key_label}数: {sum(1 for c in group_counter.values() if c > 1)}"
     )
     logger.info(f"処理時間: {processing_time:.2f}秒")
 
-    # 重複ファイル名の詳細表示（most_common を活用）
-    duplicates = [
-        (name, count) for name, count in filename_counter.most_common() if count > 1
-    ]
+    # 重複の詳細表示（出現回数の降順）
+    duplicates = sorted(
+        ((name, count) for name, count in group_counter.items() if count > 1),
+        key=lambda item: -item[1],
+    )
 
     if duplicates:
-        logger.info("\n重複ファイル名一覧")
+        logger.info(f"\n重複{key_label}一覧")
 
         # テーブルを作成
         table = Table(show_header=True, header_style="bold magenta", expand=True)
-        table.add_column("ファイル名", style="dim")
+        table.add_column(key_label, style="dim")
         table.add_column("出現回数", justify="right")
         table.add_column("ファイルパス (すべて)", style="dim", no_wrap=False)
 
-        # most_common はすでに降順ソート済み
+        # 出現回数の降順でソート済み
         for name, count in duplicates:
             # 全てのパスをテーブルに表示
-            all_paths = "\n".join([str(p) for p in filename_paths[name]])
+            all_paths = "\n".join(group_paths[name])
             table.add_row(name, str(count), all_paths)
 
         # コンソールを作成してテーブルをレンダリング
@@ -99,11 +230,11 @@ def main(
         # テーブル内容をログに記録（詳細表示）
         logger.info("重複ファイルの詳細パス:")
         for name, count in duplicates:
-            logger.info(f"- {name} (出現回数: {count}):")
-            for path in filename_paths[name]:
-                logger.info(f"  - {path}")
+            logger.info("- %s (出現回数: %d):", name, count)
+            for path in group_paths[name]:
+                logger.info("  - %s", path)
 
-        logger.info(f"重複ファイル名の詳細: {len(duplicates)}件")
+        logger.info(f"重複{key_label}の詳細: {len(duplicates)}件")
 
     logger.info("JPEG画像カウント処理が完了しました")
 